@@ -1,4 +1,6 @@
+import asyncio
 import importlib
+import inspect
 import logging
 import os
 import sys
@@ -6,6 +8,8 @@ from typing import Dict, Any
 
 import uvicorn
 from fastapi import FastAPI, HTTPException
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 
 # Configure logging
@@ -16,7 +20,8 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=4)
 
 # Global dictionary to hold agent instances
 agent_instances: Dict[str, Any] = {}
@@ -24,6 +29,14 @@ agent_instances: Dict[str, Any] = {}
 class MessageRequest(BaseModel):
     message: str
 
+async def _run_agent(agent: Any, message: str) -> Any:
+    # Prefer pydantic-ai's native async run; push a blocking run_sync onto a thread
+    if inspect.iscoroutinefunction(getattr(agent, "run", None)):
+        return await agent.run(message)
+    if inspect.iscoroutinefunction(agent.run_sync):
+        return await agent.run_sync(message)
+    return await asyncio.to_thread(agent.run_sync, message)
+
 @app.post("/agents/{agent_id}/run_sync")
 async def run_agent_sync(agent_id: str, request: MessageRequest):
     logger.info(f"Received request for agent {agent_id}: {request.message}")
@@ -35,9 +48,9 @@ async def run_agent_sync(agent_id: str, request: MessageRequest):
     agent = agent_instances[agent_id]
     try:
         logger.info(f"Running agent {agent_id}")
-        result = await agent.run_sync(request.message)
-        logger.info(f"Agent {agent_id} response: {result}")
-        return result
+        result = await _run_agent(agent, request.message)
+        logger.info(f"Agent {agent_id} response: {result.data}")
+        return {"result": result.data, "usage": result.usage()}
     except Exception as e:
         logger.exception(f"Error running agent {agent_id}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -50,7 +63,15 @@ def start_fastapi(port: int):
             logger.info(f"  {key}={value}")
             
     logger.info(f"Starting FastAPI server on port {port}")
-    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=port,
+        loop="auto",
+        http="auto",
+        log_level="warning",
+        access_log=False,
+    )
 
 if __name__ == "__main__":
     logger.info(f"Starting agent wrapper with args: {sys.argv}")
@@ -4,23 +4,123 @@ for agent management and execution.
 """
 import asyncio
 import logging
-from typing import Any, AsyncIterator, Dict, List, Optional
+import time
+from typing import Any, AsyncIterator, Dict, List, Literal, Optional, Tuple, Type
 
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse, StreamingResponse
-from pydantic import BaseModel, ValidationError
+import orjson
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError, create_model
+from pydantic_core import to_json
 from pydantic_ai import Agent
 from pydantic_ai.exceptions import UnexpectedModelBehavior
-from pydantic_ai.message import ModelMessage
+from pydantic_ai.messages import ModelMessage
+from pydantic_ai.tools import Tool
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title='Axon Pydantic Agent Wrapper')
+app = FastAPI(
+    title='Axon Pydantic Agent Wrapper',
+    default_response_class=ORJSONResponse
+)
+
+class _GZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves the SSE stream uncompressed so frames are not held back."""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] == "/run/stream":
+            await self.app(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+app.add_middleware(_GZipMiddleware, minimum_size=1024, compresslevel=4)
 
 # Global registry for agent instances
-agent_instances: Dict[str, Agent] = {}
+class AgentRegistry:
+    """Agent registry stored as parallel columns indexed by slot.
+
+    Scans over IDs or usage timestamps only touch those columns, never the
+    Agent objects themselves. Removal swaps the last slot into the hole so
+    the columns stay dense.
+    """
+
+    def __init__(self) -> None:
+        self.ids: List[str] = []
+        self.agents: List[Agent] = []
+        self.last_used: List[float] = []
+        self._by_id: Dict[str, int] = {}
+
+    def __contains__(self, agent_id: str) -> bool:
+        return agent_id in self._by_id
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, agent_id: str, agent: Agent) -> Agent:
+        """Register an agent unless the ID is taken; return the registered agent."""
+        slot = self._by_id.get(agent_id)
+        if slot is not None:
+            return self.agents[slot]
+        self._by_id[agent_id] = len(self.ids)
+        self.ids.append(agent_id)
+        self.agents.append(agent)
+        self.last_used.append(time.monotonic())
+        return agent
+
+    def get(self, agent_id: str) -> Optional[Agent]:
+        """Get an agent by ID, marking it as used."""
+        slot = self._by_id.get(agent_id)
+        if slot is None:
+            return None
+        self.last_used[slot] = time.monotonic()
+        return self.agents[slot]
+
+    def remove(self, agent_id: str) -> bool:
+        """Remove an agent; return whether it was registered."""
+        slot = self._by_id.pop(agent_id, None)
+        if slot is None:
+            return False
+        columns = (self.ids, self.agents, self.last_used)
+        last = len(self.ids) - 1
+        if slot != last:
+            for column in columns:
+                column[slot] = column[last]
+            self._by_id[self.ids[slot]] = slot
+        for column in columns:
+            column.pop()
+        return True
+
+agent_registry = AgentRegistry()
+
+# Streamed text is coalesced until a frame reaches this many characters
+# or this many seconds have passed since the last frame
+_STREAM_FLUSH_SIZE = 4096
+_STREAM_FLUSH_INTERVAL = 0.25
+
+# Pre-encoded SSE framing
+_SSE_PREFIX = b"data: "
+_SSE_SUFFIX = b"\n\n"
+_SSE_DONE = b"data: [DONE]\n\n"
+
+# Pre-encoded head of every {"status": "success", "message": ...} body
+_OK_PREFIX = b'{"status":"success","message":'
+
+# JSON schema type names mapped to the Python types used for result fields
+_TYPE_MAP: Dict[str, type] = {
+    "string": str,
+    "integer": int,
+    "boolean": bool,
+    "number": float,
+    "array": list,
+    "object": dict,
+    "null": type(None),
+}
+
+# Result models built from JSON schemas, keyed on their (field, type) pairs
+_result_model_cache: Dict[Tuple[Tuple[str, str], ...], Type[BaseModel]] = {}
 
 # Request/Response Models
 class AgentConfig(BaseModel):
@@ -30,6 +130,9 @@ class AgentConfig(BaseModel):
     system_prompt: str
     tools: Optional[List[Dict[str, Any]]] = None
     result_type: Optional[Dict[str, Any]] = None
+    retries: int = 1
+    result_retries: Optional[int] = None
+    end_strategy: Literal["early", "exhaustive"] = "early"
 
 class RunRequest(BaseModel):
     """Request for running an agent."""
@@ -48,29 +151,59 @@ class ToolCallRequest(BaseModel):
 # Error Handling
 class AgentError(Exception):
     """Base class for agent-related errors."""
-    pass
+    status_code = 500
 
 class AgentNotFoundError(AgentError):
     """Raised when an agent is not found in the registry."""
+    status_code = 404
+
+class InvalidResultTypeError(AgentError):
+    """Raised when a result_type schema uses a field type that cannot be mapped."""
+    status_code = 422
+
+class AgentExistsError(AgentError):
+    """Raised when registering an agent under an ID that is already taken."""
+    status_code = 400
+
+class ToolNotFoundError(AgentError):
+    """Raised when an agent has no tool with the requested name."""
     pass
 
+class ToolExecutionError(AgentError):
+    """Raised when a tool function fails while being called directly."""
+    pass
+
+class ToolRequiresContextError(AgentError):
+    """Raised when calling a tool that needs a RunContext outside of an agent run."""
+    status_code = 400
+
 @app.exception_handler(AgentError)
 async def agent_error_handler(request, exc):
-    return JSONResponse(
-        status_code=404 if isinstance(exc, AgentNotFoundError) else 500,
+    return ORJSONResponse(
+        status_code=exc.status_code,
         content={"error": str(exc)}
     )
 
 @app.exception_handler(ValidationError)
 async def validation_error_handler(request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=422,
         content={"error": str(exc)}
     )
 
 @app.exception_handler(UnexpectedModelBehavior)
 async def model_error_handler(request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
+        status_code=500,
+        content={"error": str(exc)}
+    )
+
+@app.exception_handler(Exception)
+async def generic_exception_handler(request, exc):
+    # ServerErrorMiddleware re-raises after this handler, so uvicorn already
+    # logs the full traceback; formatting it here as well would do it twice
+    logger.error("Unexpected %s: %s", type(exc).__name__, exc)
+    return ORJSONResponse(
         status_code=500,
         content={"error": str(exc)}
     )
@@ -79,25 +212,29 @@ async def model_error_handler(request, exc):
 @app.post("/agents")
 async def create_agent(config: AgentConfig):
     """Create and register a new agent instance."""
+    result_type = _resolve_result_type(config.result_type) if config.result_type else str
     try:
         agent = Agent(
             config.model,
             system_prompt=config.system_prompt,
-            tools=config.tools,
-            result_type=config.result_type
+            tools=config.tools or (),
+            result_type=result_type,
+            retries=config.retries,
+            result_retries=config.result_retries,
+            end_strategy=config.end_strategy
         )
-        agent_instances[config.agent_id] = agent
-        return {"status": "success", "message": f"Agent {config.agent_id} created"}
     except Exception as e:
         logger.error(f"Error creating agent: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    if agent_registry.add(config.agent_id, agent) is not agent:
+        raise AgentExistsError(f"Agent {config.agent_id} already exists")
+    return _ok_response(f"Agent {config.agent_id} created")
 
 @app.delete("/agents/{agent_id}")
 async def delete_agent(agent_id: str):
     """Remove an agent from the registry."""
-    if agent_id in agent_instances:
-        del agent_instances[agent_id]
-        return {"status": "success", "message": f"Agent {agent_id} deleted"}
+    if agent_registry.remove(agent_id):
+        return _ok_response(f"Agent {agent_id} deleted")
     raise AgentNotFoundError(f"Agent {agent_id} not found")
 
 # Agent Execution Endpoints
@@ -111,11 +248,11 @@ async def run_agent(agent_id: str, request: RunRequest):
             message_history=request.message_history,
             model_settings=request.model_settings
         )
-        return {
+        return _ModelJSONResponse({
             "result": result.data,
             "messages": result.all_messages(),
-            "usage": result.usage
-        }
+            "usage": result.usage()
+        })
     except Exception as e:
         logger.error(f"Error running agent: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -124,50 +261,135 @@ async def run_agent(agent_id: str, request: RunRequest):
 async def run_agent_stream(agent_id: str, request: RunRequest):
     """Run an agent and stream the response."""
     agent = _get_agent(agent_id)
-    try:
-        result = await agent.run_stream(
-            request.prompt,
-            message_history=request.message_history,
-            model_settings=request.model_settings
-        )
-        return StreamingResponse(
-            _stream_response(result),
-            media_type="text/event-stream"
-        )
-    except Exception as e:
-        logger.error(f"Error streaming agent response: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(
+        _stream_response(agent, request),
+        media_type="text/event-stream"
+    )
 
 @app.post("/tool_call")
 async def call_tool(agent_id: str, request: ToolCallRequest):
     """Call a specific tool on an agent."""
-    agent = _get_agent(agent_id)
+    tool = _get_tool(agent_id, request.tool_name)
+    if tool.takes_ctx:
+        raise ToolRequiresContextError(
+            f"Tool {tool.name} takes a RunContext and can only be called during an agent run"
+        )
+    args, kwargs = _tool_call_args(tool, tool._validator.validate_python(request.args))
     try:
-        result = await agent.call_tool(request.tool_name, request.args)
-        return {"result": result}
+        if tool._is_async:
+            result = await tool.function(*args, **kwargs)
+        else:
+            result = await asyncio.to_thread(tool.function, *args, **kwargs)
     except Exception as e:
         logger.error(f"Error calling tool: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise ToolExecutionError(f"Tool {tool.name} failed: {e}") from e
+    return _ModelJSONResponse({"result": result})
 
 # Helper Functions
+def _default(obj: Any) -> orjson.Fragment:
+    """Encode objects orjson cannot serialize natively straight to JSON with pydantic-core."""
+    return orjson.Fragment(to_json(obj))
+
+def _sse_frame(obj: Any) -> bytes:
+    """Encode an object as an SSE data frame without a str round trip."""
+    return _SSE_PREFIX + orjson.dumps(obj, default=_default) + _SSE_SUFFIX
+
+class _ModelJSONResponse(ORJSONResponse):
+    """ORJSONResponse that renders Pydantic models and dataclasses in a single pass.
+
+    Rendered with pydantic-core rather than orjson, because orjson raises
+    on non-str dict keys and integers wider than 64 bits instead of
+    calling its default hook, and arbitrary tool results can contain both.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
+
+def _ok_response(message: str) -> Response:
+    """Build a success response, encoding the body directly with orjson."""
+    return Response(
+        _OK_PREFIX + orjson.dumps(message) + b"}",
+        media_type="application/json"
+    )
+
 def _get_agent(agent_id: str) -> Agent:
     """Get an agent from the registry or raise an error."""
-    agent = agent_instances.get(agent_id)
-    if not agent:
+    agent = agent_registry.get(agent_id)
+    if agent is None:
         raise AgentNotFoundError(f"Agent {agent_id} not found")
     return agent
 
-async def _stream_response(result: AsyncIterator[str]) -> AsyncIterator[str]:
-    """Stream agent responses in SSE format."""
+def _get_tool(agent_id: str, tool_name: str) -> Tool:
+    """Look up a tool by name on a registered agent."""
+    # pydantic-ai already keys an agent's tools by name and keeps that dict
+    # current as tools are registered, so no separate index is needed
+    tool = _get_agent(agent_id)._function_tools.get(tool_name)
+    if tool is None:
+        raise ToolNotFoundError(f"Tool {tool_name} not found for agent {agent_id}")
+    return tool
+
+def _tool_call_args(tool: Tool, args_dict: Dict[str, Any]) -> Tuple[List[Any], Dict[str, Any]]:
+    """Split validated tool arguments into positional and keyword arguments like pydantic-ai does."""
+    if tool._single_arg_name:
+        args_dict = {tool._single_arg_name: args_dict}
+    args = [args_dict.pop(name) for name in tool._positional_fields]
+    if tool._var_positional_field:
+        args.extend(args_dict.pop(tool._var_positional_field))
+    return args, args_dict
+
+def _resolve_result_type(result_type_config: Dict[str, Any]) -> Type[BaseModel]:
+    """Get a Pydantic model for a JSON schema-like definition, building it once."""
+    field_types = {}
+    for name, info in result_type_config.get("properties", {}).items():
+        type_name = info.get("type") if isinstance(info, dict) else None
+        if not isinstance(type_name, str) or type_name not in _TYPE_MAP:
+            raise InvalidResultTypeError(f"Result field {name!r} has unsupported type {type_name!r}")
+        field_types[name] = type_name
+    key = tuple(sorted(field_types.items()))
+    model = _result_model_cache.get(key)
+    if model is None:
+        fields = {name: (_TYPE_MAP[type_name], ...) for name, type_name in key}
+        model = create_model("ResultModel", **fields)
+        _result_model_cache[key] = model
+    return model
+
+async def _stream_response(agent: Agent, request: RunRequest) -> AsyncIterator[bytes]:
+    """Stream agent responses in SSE format, batching text deltas into larger frames."""
+    loop = asyncio.get_running_loop()
     try:
-        async for chunk in result:
-            yield f"data: {chunk}\n\n"
+        async with agent.run_stream(
+            request.prompt,
+            message_history=request.message_history,
+            model_settings=request.model_settings
+        ) as result:
+            buffer: List[str] = []
+            buffered = 0
+            last_flush = loop.time()
+            async for text in result.stream_text(delta=True):
+                buffer.append(text)
+                buffered += len(text)
+                if buffered >= _STREAM_FLUSH_SIZE or loop.time() - last_flush >= _STREAM_FLUSH_INTERVAL:
+                    yield _sse_frame("".join(buffer))
+                    buffer.clear()
+                    buffered = 0
+                    last_flush = loop.time()
+            if buffer:
+                yield _sse_frame("".join(buffer))
     except Exception as e:
         logger.error(f"Error in stream: {e}")
-        yield f"error: {str(e)}\n\n"
-    finally:
-        yield "data: [DONE]\n\n"
+        yield f"error: {str(e)}\n\n".encode()
+    # Not in a finally block: on client disconnect the generator is closed
+    # with GeneratorExit and must not yield again
+    yield _SSE_DONE
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="auto",
+        http="auto",
+        log_level="warning",
+        access_log=False,
+    )
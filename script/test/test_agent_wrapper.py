@@ -0,0 +1,104 @@
+"""Tests for the generic agent wrapper."""
+import threading
+from dataclasses import dataclass
+
+import pytest
+from fastapi.testclient import TestClient
+
+from axon_python.agent_wrapper import agent_instances, app
+
+@dataclass
+class StubUsage:
+    requests: int = 1
+
+class StubResult:
+    """Stand-in for a pydantic-ai RunResult, including a private field."""
+
+    def __init__(self, data):
+        self.data = data
+        self._all_messages = ["hidden"]
+
+    def usage(self):
+        return StubUsage()
+
+class AsyncRunAgent:
+    """Agent exposing a native async run."""
+
+    async def run(self, message):
+        return StubResult(f"run: {message}")
+
+    def run_sync(self, message):
+        raise AssertionError("run_sync should not be used when run is async")
+
+class CoroutineRunSyncAgent:
+    """Agent whose run_sync is itself a coroutine function."""
+
+    async def run_sync(self, message):
+        return StubResult(f"run_sync: {message}")
+
+class BlockingRunSyncAgent:
+    """Agent with only a blocking run_sync, recording the thread it ran on."""
+
+    def __init__(self):
+        self.thread = None
+
+    def run_sync(self, message):
+        self.thread = threading.current_thread()
+        return StubResult(f"thread: {message}")
+
+@pytest.fixture
+def test_client():
+    """Create a test client for the FastAPI app."""
+    return TestClient(app)
+
+@pytest.fixture
+def register():
+    """Register stub agents and remove them afterwards."""
+    added = []
+
+    def _register(agent_id, agent):
+        agent_instances[agent_id] = agent
+        added.append(agent_id)
+        return agent
+
+    yield _register
+    for agent_id in added:
+        agent_instances.pop(agent_id, None)
+
+def _run(test_client, agent_id, message="hi"):
+    return test_client.post(f"/agents/{agent_id}/run_sync", json={"message": message})
+
+class TestRunDispatch:
+    """Test how run_agent_sync picks a way to run the agent."""
+
+    def test_async_run(self, test_client, register):
+        """Test that a native async run is awaited directly."""
+        register("async_run", AsyncRunAgent())
+        response = _run(test_client, "async_run")
+        assert response.status_code == 200
+        assert response.json() == {"result": "run: hi", "usage": {"requests": 1}}
+
+    def test_coroutine_run_sync(self, test_client, register):
+        """Test that a coroutine run_sync is awaited directly."""
+        register("coroutine_run_sync", CoroutineRunSyncAgent())
+        response = _run(test_client, "coroutine_run_sync")
+        assert response.status_code == 200
+        assert response.json() == {"result": "run_sync: hi", "usage": {"requests": 1}}
+
+    def test_blocking_run_sync_uses_thread(self, test_client, register):
+        """Test that a blocking run_sync is pushed off the event loop thread."""
+        agent = register("blocking_run_sync", BlockingRunSyncAgent())
+        response = _run(test_client, "blocking_run_sync")
+        assert response.status_code == 200
+        assert response.json() == {"result": "thread: hi", "usage": {"requests": 1}}
+        assert agent.thread is not None
+        assert agent.thread is not threading.main_thread()
+
+    def test_private_fields_not_exposed(self, test_client, register):
+        """Test that only the result and usage are returned."""
+        register("async_run", AsyncRunAgent())
+        assert "_all_messages" not in _run(test_client, "async_run").json()
+
+    def test_unknown_agent(self, test_client):
+        """Test running an agent that is not registered."""
+        assert _run(test_client, "nonexistent").status_code == 404
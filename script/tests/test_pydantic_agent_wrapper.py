@@ -1,19 +1,29 @@
 """Tests for the pydantic-ai agent wrapper."""
 import asyncio
 import json
+from contextlib import asynccontextmanager
 from typing import AsyncIterator, Dict
 
 import pytest
+from fastapi import FastAPI, Response
 from fastapi.testclient import TestClient
-from pydantic_ai import Agent
-from pydantic_ai.message import SystemPromptPart, TextPart, UserPromptPart
+from pydantic import ValidationError
+from pydantic_ai import Agent, RunContext
+from pydantic_ai.messages import SystemPromptPart, TextPart, UserPromptPart
 
+from axon_python import pydantic_agent_wrapper
 from axon_python.pydantic_agent_wrapper import (
     AgentConfig,
     AgentError,
     AgentNotFoundError,
+    AgentRegistry,
+    InvalidResultTypeError,
     RunRequest,
     ToolCallRequest,
+    _GZipMiddleware,
+    _resolve_result_type,
+    _stream_response,
+    agent_registry,
     app,
 )
 
@@ -48,6 +58,17 @@ def agent_config():
         }
     )
 
+@pytest.fixture
+def offline_agent_config():
+    """Create an agent configuration on the offline test model, removing the agent afterwards."""
+    config = {
+        "agent_id": "offline_agent",
+        "model": "test",
+        "system_prompt": "You are a test assistant."
+    }
+    yield config
+    agent_registry.remove(config["agent_id"])
+
 @pytest.fixture
 def run_request():
     """Create a test run request."""
@@ -81,14 +102,35 @@ class TestAgentManagement:
         assert response.status_code == 200
         assert response.json()["status"] == "success"
 
-    def test_create_duplicate_agent(self, test_client, agent_config):
+    def test_create_duplicate_agent(self, test_client, offline_agent_config):
         """Test creating a duplicate agent."""
         # Create first agent
-        test_client.post("/agents", json=agent_config.model_dump())
-        
+        response = test_client.post("/agents", json=offline_agent_config)
+        assert response.status_code == 200
+        first = agent_registry.get(offline_agent_config["agent_id"])
+
         # Try to create duplicate
-        response = test_client.post("/agents", json=agent_config.model_dump())
-        assert response.status_code == 500
+        response = test_client.post("/agents", json=offline_agent_config)
+        assert response.status_code == 400
+        assert "already exists" in response.json()["error"]
+        assert agent_registry.get(offline_agent_config["agent_id"]) is first
+
+    def test_create_agent_run_settings(self, test_client, offline_agent_config):
+        """Test that retry and end-strategy settings are passed to the agent."""
+        config = dict(offline_agent_config, retries=2, result_retries=4, end_strategy="exhaustive")
+        response = test_client.post("/agents", json=config)
+        assert response.status_code == 200
+        agent = agent_registry.get(config["agent_id"])
+        assert agent._default_retries == 2
+        assert agent._max_result_retries == 4
+        assert agent.end_strategy == "exhaustive"
+
+    def test_create_agent_invalid_end_strategy(self, test_client, offline_agent_config):
+        """Test that an unknown end strategy is rejected."""
+        config = dict(offline_agent_config, end_strategy="eventually")
+        response = test_client.post("/agents", json=config)
+        assert response.status_code == 422
+        assert config["agent_id"] not in agent_registry
 
     def test_delete_agent(self, test_client, agent_config):
         """Test deleting an agent."""
@@ -105,6 +147,31 @@ class TestAgentManagement:
         response = test_client.delete("/agents/nonexistent")
         assert response.status_code == 404
 
+@pytest.fixture
+def tool_agent():
+    """Register an agent with plain and context tools on the offline test model."""
+    agent = Agent("test")
+
+    @agent.tool_plain
+    def add(a: int, b: int) -> int:
+        return a + b
+
+    @agent.tool_plain
+    async def shout(text: str) -> str:
+        return text.upper()
+
+    @agent.tool_plain
+    def boom() -> str:
+        raise RuntimeError("kaboom")
+
+    @agent.tool
+    def whoami(ctx: RunContext[None]) -> str:
+        return "agent"
+
+    agent_registry.add("tool_agent", agent)
+    yield agent
+    agent_registry.remove("tool_agent")
+
 class TestAgentExecution:
     """Test agent execution endpoints."""
 
@@ -197,3 +264,219 @@ class TestErrorHandling:
             json=request
         )
         assert response.status_code == 500
+
+class FakeStreamAgent:
+    """Stand-in agent whose streamed run yields fixed text deltas."""
+
+    def __init__(self, deltas, error=None):
+        self.deltas = deltas
+        self.error = error
+
+    @asynccontextmanager
+    async def run_stream(self, prompt, **kwargs):
+        yield self
+
+    async def stream_text(self, delta=False):
+        assert delta
+        for text in self.deltas:
+            yield text
+        if self.error:
+            raise self.error
+
+async def _collect(agent, limit=None):
+    frames = []
+    stream = _stream_response(agent, RunRequest(prompt="Hello"))
+    async for frame in stream:
+        frames.append(frame)
+        if limit and len(frames) == limit:
+            await stream.aclose()
+            break
+    return frames
+
+class TestStreamBatching:
+    """Test coalescing of streamed text into SSE frames."""
+
+    def test_small_deltas_share_a_frame(self):
+        """Test that deltas arriving within the flush interval become one frame."""
+        frames = asyncio.run(_collect(FakeStreamAgent(["Hel", "lo", " world"])))
+        assert frames == [b'data: "Hello world"\n\n', b"data: [DONE]\n\n"]
+
+    def test_flushes_at_size(self, monkeypatch):
+        """Test that a frame is emitted once the buffer reaches the size threshold."""
+        monkeypatch.setattr(pydantic_agent_wrapper, "_STREAM_FLUSH_SIZE", 5)
+        frames = asyncio.run(_collect(FakeStreamAgent(["abc", "def", "gh"])))
+        assert frames == [b'data: "abcdef"\n\n', b'data: "gh"\n\n', b"data: [DONE]\n\n"]
+
+    def test_flushes_at_interval(self, monkeypatch):
+        """Test that a frame is emitted once the flush interval has passed."""
+        monkeypatch.setattr(pydantic_agent_wrapper, "_STREAM_FLUSH_INTERVAL", 0)
+        frames = asyncio.run(_collect(FakeStreamAgent(["a", "b"])))
+        assert frames == [b'data: "a"\n\n', b'data: "b"\n\n', b"data: [DONE]\n\n"]
+
+    def test_error_then_done(self):
+        """Test that a stream error is reported before the terminator."""
+        frames = asyncio.run(_collect(FakeStreamAgent([], error=RuntimeError("lost"))))
+        assert frames == [b"error: lost\n\n", b"data: [DONE]\n\n"]
+
+    def test_client_disconnect(self, monkeypatch):
+        """Test that closing the stream early does not yield again."""
+        monkeypatch.setattr(pydantic_agent_wrapper, "_STREAM_FLUSH_INTERVAL", 0)
+        frames = asyncio.run(_collect(FakeStreamAgent(["a", "b", "c"]), limit=1))
+        assert frames == [b'data: "a"\n\n']
+
+class TestCompression:
+    """Test response compression."""
+
+    def test_stream_is_not_compressed(self, test_client):
+        """Test that the SSE stream bypasses gzip even for large frames."""
+        agent_registry.add("stream_agent", FakeStreamAgent(["x" * 5000]))
+        try:
+            response = test_client.post(
+                "/run/stream?agent_id=stream_agent",
+                json={"prompt": "Hello"},
+                headers={"Accept-Encoding": "gzip"}
+            )
+        finally:
+            agent_registry.remove("stream_agent")
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+        assert response.content.endswith(b"data: [DONE]\n\n")
+
+    @pytest.mark.parametrize("path, compressed", [("/run/stream", False), ("/run", True)])
+    def test_middleware_bypasses_stream_path(self, path, compressed):
+        """Test that the gzip middleware skips /run/stream whatever the media type."""
+        inner = FastAPI()
+        inner.add_api_route(path, lambda: Response(b"x" * 5000, media_type="text/plain"))
+        client = TestClient(_GZipMiddleware(inner, minimum_size=1024))
+        response = client.get(path, headers={"Accept-Encoding": "gzip"})
+        assert (response.headers.get("content-encoding") == "gzip") is compressed
+
+    def test_large_json_is_compressed(self, test_client, tool_agent):
+        """Test that large JSON bodies are gzipped."""
+        response = test_client.post(
+            "/tool_call?agent_id=tool_agent",
+            json={"tool_name": "shout", "args": {"text": "x" * 5000}},
+            headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.json() == {"result": "X" * 5000}
+
+class TestToolCalls:
+    """Test calling registered tools directly."""
+
+    def _call(self, test_client, tool_name, args):
+        return test_client.post(
+            "/tool_call?agent_id=tool_agent",
+            json={"tool_name": tool_name, "args": args}
+        )
+
+    def test_sync_tool(self, test_client, tool_agent):
+        """Test calling a sync tool with validated arguments."""
+        response = self._call(test_client, "add", {"a": "1", "b": 2})
+        assert response.status_code == 200
+        assert response.json() == {"result": 3}
+
+    def test_async_tool(self, test_client, tool_agent):
+        """Test calling an async tool."""
+        response = self._call(test_client, "shout", {"text": "hi"})
+        assert response.status_code == 200
+        assert response.json() == {"result": "HI"}
+
+    def test_invalid_args(self, test_client, tool_agent):
+        """Test that arguments are validated against the tool's signature."""
+        response = self._call(test_client, "add", {"bad": 1})
+        assert response.status_code == 422
+
+    def test_failing_tool(self, test_client, tool_agent):
+        """Test that a failing tool returns a handled 500 rather than escaping the app."""
+        response = self._call(test_client, "boom", {})
+        assert response.status_code == 500
+        assert "kaboom" in response.json()["error"]
+
+    def test_context_tool_rejected(self, test_client, tool_agent):
+        """Test that tools needing a RunContext are refused outside a run."""
+        response = self._call(test_client, "whoami", {})
+        assert response.status_code == 400
+        assert "RunContext" in response.json()["error"]
+
+    def test_tool_registered_later(self, test_client, tool_agent):
+        """Test that tools added after earlier calls are still found."""
+        assert self._call(test_client, "add", {"a": 1, "b": 1}).status_code == 200
+
+        @tool_agent.tool_plain
+        def negate(x: int) -> int:
+            return -x
+
+        response = self._call(test_client, "negate", {"x": 4})
+        assert response.json() == {"result": -4}
+
+    @pytest.mark.parametrize("value, expected", [
+        ({1: "a"}, {"1": "a"}),
+        (2**70, 2**70),
+    ])
+    def test_result_outside_orjson_types(self, test_client, tool_agent, value, expected):
+        """Test that results with int dict keys or big ints are still encoded."""
+        @tool_agent.tool_plain
+        def odd_result() -> object:
+            return value
+
+        response = self._call(test_client, "odd_result", {})
+        assert response.status_code == 200
+        assert response.json() == {"result": expected}
+
+class TestAgentRegistry:
+    """Test the agent registry."""
+
+    def test_add_keeps_existing_agent(self):
+        """Test that registering a taken ID returns the existing agent."""
+        registry = AgentRegistry()
+        first, second = object(), object()
+        assert registry.add("agent", first) is first
+        assert registry.add("agent", second) is first
+        assert registry.get("agent") is first
+
+    def test_remove_keeps_slots_dense(self):
+        """Test that removing an agent moves the last slot into its place."""
+        registry = AgentRegistry()
+        agents = {agent_id: object() for agent_id in ("a", "b", "c")}
+        for agent_id, agent in agents.items():
+            registry.add(agent_id, agent)
+
+        assert registry.remove("a")
+        assert not registry.remove("a")
+        assert len(registry) == 2
+        assert registry.get("a") is None
+        assert registry.get("b") is agents["b"]
+        assert registry.get("c") is agents["c"]
+
+class TestResultTypeResolution:
+    """Test building result models from JSON schemas."""
+
+    def test_builds_model_fields(self, agent_config):
+        """Test that schema properties become required model fields."""
+        model = _resolve_result_type(agent_config.result_type)
+        assert model(output="ok").output == "ok"
+        with pytest.raises(ValidationError):
+            model()
+
+    def test_reuses_cached_model(self, agent_config):
+        """Test that identical schemas resolve to the same model class."""
+        first = _resolve_result_type(agent_config.result_type)
+        second = _resolve_result_type(dict(agent_config.result_type))
+        assert first is second
+
+    @pytest.mark.parametrize("field_info", [{"type": "date"}, {"anyOf": [{"type": "string"}]}])
+    def test_rejects_unsupported_type(self, field_info):
+        """Test that unmappable field types raise a client error naming the field."""
+        config = {"type": "object", "properties": {"when": field_info}}
+        with pytest.raises(InvalidResultTypeError, match="'when'"):
+            _resolve_result_type(config)
+
+    def test_create_agent_with_unsupported_type(self, test_client, agent_config):
+        """Test that creating an agent with an unmappable result type returns 422."""
+        config = agent_config.model_dump()
+        config["result_type"] = {"type": "object", "properties": {"when": {"type": "date"}}}
+        response = test_client.post("/agents", json=config)
+        assert response.status_code == 422
+        assert "'when'" in response.json()["error"]